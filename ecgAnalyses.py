@@ -1,23 +1,49 @@
 # Function List and usage
 # Assuming you have denoised ECG data/ signal, the followin ECG metrics can be extracted
 #
+# r_peaks               = find_r_peaks(denoised_ecg)
+# r_peaks, rr, n_peaks  = find_r_peaks_batch(denoised_ecgs)                      [batched over many signals, also returns RR intervals]
 # rr_intervals          = np.diff(r_peaks) / sampling_rate
-# heart_rate            = calculate_heart_rate(r_peaks)
+# heart_rate            = calculate_heart_rate(rr_intervals)
 # rhythm_status         = analyze_rhythm(rr_intervals)
+# heart_rates, rhythms  = analyze_heart_rate_rhythm(rr, n_peaks)                 [batched over many signals]
 # st_segment_changes    = analyze_st_segment(denoised_ecg, r_peaks)
-# t_wave_status         = analyze_t_wave(denoised_ecg)
-# pq_interval_status    = analyze_pq_interval(rr_intervals)
+# st_segment_changes    = analyze_st_segment_batch(denoised_ecgs, r_peaks, n_peaks) [batched over many signals]
+# t_wave_status         = analyze_t_wave(denoised_ecg, r_peaks)
+# t_wave_status         = analyze_t_wave_batch(denoised_ecgs, r_peaks, n_peaks)  [batched over many signals]
+# pq_interval_status    = analyze_pr_interval(denoised_ecg, r_peaks)
+# pq_interval_status    = analyze_pr_interval_batch(denoised_ecgs, r_peaks, n_peaks) [batched over many signals]
 #
-# Ensure following Python dependencies are installed: numpy, scipy
+# Or, for a whole table of signals at once:
+# batch                 = build_ecg_batch(raw_ecgs, denoised_ecgs)
+# metrics               = analyze_all(batch)
+#
+# All status results are int8 codes (0 = normal/regular, 1 = abnormal/irregular), use RHYTHM_LABELS[rhythm_status]
+# and STATUS_LABELS[status] to turn them into "Regular"/"Irregular" and "Normal"/"Abnormal" for display.
+#
+# Ensure following Python dependencies are installed: numpy, scipy, numba
 # Use:  ' pip install numpy'
 #       ' pip install scipy'
+#       ' pip install numba'
 #
 # Author: Kaustubh Sinha, 2023
 
 
+from dataclasses import dataclass
+from functools import lru_cache
+
 import numpy as np
 from scipy.signal import find_peaks
+from numba import njit, prange
+
 
+# Display labels of the int8 status codes returned by the analyses
+RHYTHM_LABELS = np.array(["Regular", "Irregular"])
+STATUS_LABELS = np.array(["Normal", "Abnormal"])
+
+# T-wave window after each R-peak in s: starts ~200 ms after the R-peak and lasts ~160 ms
+T_WAVE_START = 0.2
+T_WAVE_DURATION = 0.16
 
 def find_r_peaks(ecg_signal, threshold=0.2, sampling_rate=1000):
     """ Find R-peaks in an ECG signal.
@@ -34,23 +60,75 @@ def find_r_peaks(ecg_signal, threshold=0.2, sampling_rate=1000):
 
     return peaks
 
-def calculate_heart_rate(r_peak_indices, sampling_rate=1000):
-    """ Calculate heart rate from R-peak indices.
+@njit(parallel=True, nogil=True, fastmath=True, cache=True)
+def detect_r_peaks(X, thresh, inv_fs, out_idx, out_rr, out_count):
+    """ Find R-peaks (local maxima above a threshold) and RR intervals in every row of a 2D array of ECG signals.
 
     Args:
-        r_peak_indices (array):         Indices of R-peaks.
+        X (array):                      2D array of ECG signals, one signal per row.
+        thresh (float):                 Peak detection threshold.
+        inv_fs (float):                 Inverse of the sampling rate (sampling period) in s.
+        out_idx (array):                Preallocated (rows, max_peaks) int array, filled with the R-peak indices of each row.
+        out_rr (array):                 Preallocated (rows, max_peaks - 1) float array, filled with the RR intervals of each row.
+        out_count (array):              Preallocated (rows,) int array, filled with the number of R-peaks of each row.
+    """
+    n_rows, n_samples = X.shape
+    max_peaks = out_idx.shape[1]
+
+    for r in prange(n_rows):
+        k = 0
+        prev = 0
+        for i in range(1, n_samples - 1):
+            # Cheapest and least likely condition first, so most samples are rejected by a single compare
+            if X[r, i] > thresh and X[r, i] >= X[r, i - 1] and X[r, i] > X[r, i + 1] and k < max_peaks:
+                out_idx[r, k] = i
+                # Emit the RR interval to the previous peak right away instead of diffing the indices afterwards
+                if k > 0:
+                    out_rr[r, k - 1] = (i - prev) * inv_fs
+                prev = i
+                k += 1
+        out_count[r] = k
+
+def find_r_peaks_batch(ecg_signals, threshold=0.2, sampling_rate=1000):
+    """ Find R-peaks and RR intervals in every row of a 2D array of ECG signals.
+
+    Args:
+        ecg_signals (array):            2D array of ECG signals, one signal per row.
+        threshold (float, optional):    Peak detection threshold. Default is 0.2.
         sampling_rate (int, optional):  Sampling rate in Hz. Default is 1000.
 
+    Returns:
+        r_peak_indices (array):         (rows, max_peaks) indices of R-peaks, only the first r_peak_counts[j] of row j are valid.
+        rr_intervals (array):           (rows, max_peaks - 1) float32 RR intervals in s, only the first r_peak_counts[j] - 1 of row j are valid.
+        r_peak_counts (array):          Number of R-peaks of each row.
+    """
+    ecg_signals = np.ascontiguousarray(ecg_signals)
+    n_rows, n_samples = ecg_signals.shape
+
+    # A strict local maximum needs a lower sample after it, so a row can never hold more peaks than this
+    max_peaks = n_samples // 2 + 1
+    r_peak_indices = np.zeros((n_rows, max_peaks), dtype=np.int32)
+    rr_intervals = np.zeros((n_rows, max_peaks - 1), dtype=np.float32)
+    r_peak_counts = np.zeros(n_rows, dtype=np.int32)
+    detect_r_peaks(ecg_signals, threshold, 1.0 / sampling_rate, r_peak_indices, rr_intervals, r_peak_counts)
+
+    return r_peak_indices, rr_intervals, r_peak_counts
+
+def calculate_heart_rate(rr_intervals):
+    """ Calculate heart rate from RR intervals.
+
+    Args:
+        rr_intervals (array-like):      RR intervals in s (see find_r_peaks_batch).
+
     Returns:
         heart_rate (float):             Heart rate in BPM (beats per minute).
     """
-    if len(r_peak_indices) <= 1:
+    if len(rr_intervals) == 0:
         return 0  # Return 0 if not enough R-peaks are detected
 
-    rr_intervals = np.diff(r_peak_indices) / sampling_rate
     heart_rate = 60.0 / np.mean(rr_intervals)
 
-    return heart_rate, rr_intervals
+    return heart_rate
 
 def analyze_rhythm(rr_intervals, threshold=0.15):
     """ Analyze the heart rhythm based on RR intervals.
@@ -60,15 +138,75 @@ def analyze_rhythm(rr_intervals, threshold=0.15):
         threshold (float, optional):    Threshold for identifying rhythm abnormalities. Default is 0.15.
 
     Returns:
-        rhythm_status (str):            "Regular" or "Irregular" based on threshold.
+        rhythm_status (int8):           0 ("Regular") or 1 ("Irregular") based on threshold.
     """
 
     # Check threshold and classify result 
     std_dev = np.std(rr_intervals)
     if std_dev <= threshold:
-        return "Regular"
+        return np.int8(0)
     else:
-        return "Irregular"
+        return np.int8(1)
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _hr_rhythm(rr_flat, rr_offsets, rr_lens, thresh):
+    """ Heart rate and rhythm class for many signals in one pass (Welford mean/variance per row).
+
+    Args:
+        rr_flat (array):                RR intervals of all signals, concatenated.
+        rr_offsets (array):             Start of each signal's RR intervals in rr_flat.
+        rr_lens (array):                Number of RR intervals of each signal.
+        thresh (float):                 Threshold on the RR standard deviation for an irregular rhythm.
+
+    Returns:
+        heart_rate (array):             Heart rate in BPM per signal (0 if no RR intervals).
+        rhythm (array):                 int8 rhythm class per signal, 0 = "Regular", 1 = "Irregular".
+    """
+    n_rows = rr_lens.shape[0]
+    heart_rate = np.zeros(n_rows, dtype=np.float64)
+    rhythm = np.ones(n_rows, dtype=np.int8)
+
+    for r in prange(n_rows):
+        n = rr_lens[r]
+        if n == 0:
+            continue
+
+        mean = 0.0
+        m2 = 0.0
+        for k in range(n):
+            x = rr_flat[rr_offsets[r] + k]
+            delta = x - mean
+            mean += delta / (k + 1)
+            m2 += delta * (x - mean)
+
+        heart_rate[r] = 60.0 / mean
+        if np.sqrt(m2 / n) <= thresh:
+            rhythm[r] = 0
+
+    return heart_rate, rhythm
+
+def analyze_heart_rate_rhythm(rr_intervals, r_peak_counts, threshold=0.15):
+    """ Calculate the heart rate and analyze the heart rhythm of many signals at once.
+
+    Args:
+        rr_intervals (array):           (rows, max_peaks - 1) RR intervals, as returned by find_r_peaks_batch.
+        r_peak_counts (array):          Number of R-peaks of each row.
+        threshold (float, optional):    Threshold for identifying rhythm abnormalities. Default is 0.15.
+
+    Returns:
+        heart_rates (array):            Heart rate in BPM per signal (0 if not enough R-peaks are detected).
+        rhythm_status (array):          int8 per signal, 0 ("Regular") or 1 ("Irregular").
+    """
+    # View the padded RR matrix as one flat buffer, each row starting at a fixed offset
+    rr_intervals = np.ascontiguousarray(rr_intervals)
+    n_rows, row_length = rr_intervals.shape
+    rr_flat = rr_intervals.ravel()
+    rr_offsets = np.arange(n_rows, dtype=np.int64) * row_length
+    rr_lens = np.maximum(np.asarray(r_peak_counts, dtype=np.int64) - 1, 0)
+
+    heart_rates, rhythm = _hr_rhythm(rr_flat, rr_offsets, rr_lens, threshold)
+
+    return heart_rates, rhythm
 
 def analyze_st_segment(ecg_signal, r_peak_indices, sampling_rate=1000):
     """ Analyze the ST-segment for changes.
@@ -79,96 +217,315 @@ def analyze_st_segment(ecg_signal, r_peak_indices, sampling_rate=1000):
         sampling_rate (int, optional):  Sampling rate in Hz. Default is 1000.
 
     Returns:
-        st_segment_changes (str):       "Normal" or "Abnormal" based on ST-segment analysis.
+        st_segment_changes (int8):      0 ("Normal") or 1 ("Abnormal") based on ST-segment analysis.
     """
     st_segment_duration = int(0.08 * sampling_rate)  # Typically, the ST-segment is about 80 ms long
     t_segment_start = int(0.2 * sampling_rate)  # T-segment usually starts around 200 ms after the R-peak
 
-    # Find ST and TP segments
-    st_segments = [ecg_signal[r_peak + t_segment_start:r_peak + t_segment_start + st_segment_duration]
-                   for r_peak in r_peak_indices]
-    
-    tp_segments = [ecg_signal[r_peak - st_segment_duration:r_peak]
-                   for r_peak in r_peak_indices]
+    # Drop beats whose windows run past either end of the signal
+    r_peak_indices = np.asarray(r_peak_indices, dtype=np.intp)
+    valid = (r_peak_indices - st_segment_duration >= 0) & \
+            (r_peak_indices + t_segment_start + st_segment_duration <= len(ecg_signal))
+    r_peak_indices = r_peak_indices[valid]
+    if len(r_peak_indices) == 0:
+        return np.int8(0)  # No complete beat to classify
+
+    # Prefix sums of the signal: the sum over any window [a, b) is then cumulative[b] - cumulative[a]
+    cumulative = np.concatenate(([0.0], np.cumsum(ecg_signal, dtype=np.float64)))
+    tp_sums = cumulative[r_peak_indices] - cumulative[r_peak_indices - st_segment_duration]
+    st_sums = cumulative[r_peak_indices + t_segment_start + st_segment_duration] - cumulative[r_peak_indices + t_segment_start]
 
     # Find ST baseline over all 
-    st_baseline = np.mean(tp_segments)
-    st_amplitudes = [np.mean(st_segment) - st_baseline for st_segment in st_segments]
+    st_baseline = tp_sums.sum() / (len(r_peak_indices) * st_segment_duration)
+    st_amplitudes = st_sums / st_segment_duration - st_baseline
     
     # Check ST amplitude threshold and return status
-    for st_amplitude in st_amplitudes:
-        if abs(st_amplitude) > 0.1:  # Adjust this threshold as needed
-            return "Abnormal"
+    if np.any(np.abs(st_amplitudes) > 0.1):  # Adjust this threshold as needed
+        return np.int8(1)
     
-    return "Normal"
+    return np.int8(0)
+
+def _valid_peak_slots(r_peak_indices, r_peak_counts, lo, hi, n_samples):
+    """ Mask the padded R-peak slots that hold a beat whose window [r + lo, r + hi) stays inside the signal.
+
+    Args:
+        r_peak_indices (array):         (rows, max_peaks) indices of R-peaks, as returned by find_r_peaks_batch.
+        r_peak_counts (array):          Number of R-peaks of each row.
+        lo (int):                       Start of the window relative to the R-peak (may be negative).
+        hi (int):                       End (exclusive) of the window relative to the R-peak.
+        n_samples (int):                Length of the signals.
+
+    Returns:
+        r_peak_indices (array):         (rows, slots) int64 R-peak indices, invalid slots replaced by an in-bounds placeholder.
+        valid (array):                  (rows, slots) boolean mask of the usable beats.
+    """
+    # No beat can be used if the window does not fit in the signal at all
+    placeholder = max(-lo, 0)
+    n_slots = max(np.max(r_peak_counts, initial=0), 1) if placeholder + hi <= n_samples else 0
+
+    r_peak_indices = r_peak_indices[:, :n_slots].astype(np.int64)
+    valid = (np.arange(n_slots)[None, :] < np.asarray(r_peak_counts)[:, None]) & \
+            (r_peak_indices + lo >= 0) & \
+            (r_peak_indices + hi <= n_samples)
+
+    return np.where(valid, r_peak_indices, placeholder), valid
+
+def _masked_row_mean(values, valid):
+    """ Mean of each row of values over its valid slots (NaN for rows without any). """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid, values, 0.0).sum(axis=1) / valid.sum(axis=1)
+
+def analyze_st_segment_batch(ecg_signals, r_peak_indices, r_peak_counts, sampling_rate=1000):
+    """ Analyze the ST-segment for changes in every row of a 2D array of ECG signals.
+
+    Args:
+        ecg_signals (array):            2D array of ECG signals, one signal per row.
+        r_peak_indices (array):         (rows, max_peaks) indices of R-peaks, as returned by find_r_peaks_batch.
+        r_peak_counts (array):          Number of R-peaks of each row.
+        sampling_rate (int, optional):  Sampling rate in Hz. Default is 1000.
+
+    Returns:
+        st_segment_changes (array):     int8 per row, 0 ("Normal") or 1 ("Abnormal") based on ST-segment analysis.
+    """
+    st_segment_duration = int(0.08 * sampling_rate)  # Same windows as analyze_st_segment
+    t_segment_start = int(0.2 * sampling_rate)
+
+    # Mask of the R-peak slots that hold a beat whose windows stay inside the signal
+    r_peak_indices, valid = _valid_peak_slots(r_peak_indices, r_peak_counts, -st_segment_duration,
+                                              t_segment_start + st_segment_duration, ecg_signals.shape[-1])
+
+    # Row-wise prefix sums give every TP and ST window sum from two lookups
+    cumulative = np.concatenate((np.zeros((ecg_signals.shape[0], 1)), np.cumsum(ecg_signals, axis=1, dtype=np.float64)), axis=1)
 
-def analyze_t_wave(ecg_signal, threshold=0.1):
+    tp_sums = np.take_along_axis(cumulative, r_peak_indices, axis=1) - \
+              np.take_along_axis(cumulative, r_peak_indices - st_segment_duration, axis=1)
+    st_sums = np.take_along_axis(cumulative, r_peak_indices + t_segment_start + st_segment_duration, axis=1) - \
+              np.take_along_axis(cumulative, r_peak_indices + t_segment_start, axis=1)
+
+    # Find ST baseline over all beats of each row
+    st_baseline = _masked_row_mean(tp_sums, valid) / st_segment_duration
+    st_amplitudes = st_sums / st_segment_duration - st_baseline[:, None]
+
+    return np.any(valid & (np.abs(st_amplitudes) > 0.1), axis=1).astype(np.int8)
+
+@lru_cache(maxsize=8)
+def _t_wave_offsets(sampling_rate):
+    """ Sample offsets of the T-wave window relative to an R-peak, computed once per sampling rate. """
+    offsets = np.arange(int(T_WAVE_START * sampling_rate), int((T_WAVE_START + T_WAVE_DURATION) * sampling_rate))
+    offsets.setflags(write=False)  # Shared between calls through the cache
+    return offsets
+
+def analyze_t_wave(ecg_signal, r_peak_indices, sampling_rate=1000, threshold=0.1):
     """ Analyze T-wave morphology for abnormalities.
 
     Args:
         ecg_signal (array-like):        The ECG signal.
+        r_peak_indices (array-like):    Indices of R-peaks.
+        sampling_rate (int, optional):  Sampling rate in Hz. Default is 1000.
         threshold (float, optional):    Threshold for T-wave analysis. Default is 0.1.
 
     Returns:
-        t_wave_status (str):            "Normal" or "Abnormal" based on T-wave analysis.
+        t_wave_status (int8):           0 ("Normal") or 1 ("Abnormal") based on T-wave analysis.
     """
-    t_wave_start = int(0.35 * len(ecg_signal))  # Assume T-wave starts approximately 350 ms into the ECG
-    t_wave_duration = int(0.25 * len(ecg_signal))  # T-wave duration is typically about 250 ms
+    t_wave_offsets = _t_wave_offsets(sampling_rate)
+    if t_wave_offsets.size == 0:
+        return np.int8(0)  # The window rounds to no samples at this sampling rate: nothing to classify, as with no beats
+
+    # Drop beats whose T-wave window runs past the end of the signal
+    ecg_signal = np.asarray(ecg_signal)
+    r_peak_indices = np.asarray(r_peak_indices, dtype=np.intp)
+    r_peak_indices = r_peak_indices[r_peak_indices + t_wave_offsets[-1] < len(ecg_signal)]
+    if len(r_peak_indices) == 0:
+        return np.int8(0)  # No complete beat to classify
 
-    t_wave_amplitude = np.max(ecg_signal[t_wave_start:t_wave_start + t_wave_duration]) - np.min(ecg_signal[t_wave_start:t_wave_start + t_wave_duration])
+    # Gather the (N_peaks, window) T-wave block and take the peak-to-peak amplitude of every beat
+    t_wave_amplitudes = np.ptp(ecg_signal[r_peak_indices[:, None] + t_wave_offsets[None, :]], axis=1)
 
     # Check average T-wave threshold and classify result 
-    if t_wave_amplitude < threshold:
-        return "Abnormal"
+    if np.mean(t_wave_amplitudes) < threshold:
+        return np.int8(1)
+
+    return np.int8(0)
+
+def analyze_t_wave_batch(ecg_signals, r_peak_indices, r_peak_counts, sampling_rate=1000, threshold=0.1):
+    """ Analyze T-wave morphology for abnormalities in every row of a 2D array of ECG signals.
+
+    Args:
+        ecg_signals (array):            2D array of ECG signals, one signal per row.
+        r_peak_indices (array):         (rows, max_peaks) indices of R-peaks, as returned by find_r_peaks_batch.
+        r_peak_counts (array):          Number of R-peaks of each row.
+        sampling_rate (int, optional):  Sampling rate in Hz. Default is 1000.
+        threshold (float, optional):    Threshold for T-wave analysis. Default is 0.1.
+
+    Returns:
+        t_wave_status (array):          int8 per row, 0 ("Normal") or 1 ("Abnormal") based on T-wave analysis.
+    """
+    t_wave_offsets = _t_wave_offsets(sampling_rate)
+    n_rows, n_samples = ecg_signals.shape
+    if t_wave_offsets.size == 0:
+        return np.zeros(n_rows, dtype=np.int8)  # Same as analyze_t_wave for a window of no samples
+
+    # Mask of the R-peak slots that hold a beat whose T-wave window stays inside the signal
+    r_peak_indices, valid = _valid_peak_slots(r_peak_indices, r_peak_counts, t_wave_offsets[0],
+                                              t_wave_offsets[-1] + 1, n_samples)
+
+    # Gather the (rows, max_peaks, window) T-wave blocks and average the peak-to-peak amplitudes of each row
+    t_wave_blocks = ecg_signals[np.arange(n_rows)[:, None, None], r_peak_indices[:, :, None] + t_wave_offsets]
+    mean_t_wave_amplitudes = _masked_row_mean(np.ptp(t_wave_blocks, axis=2), valid)
+
+    return (mean_t_wave_amplitudes < threshold).astype(np.int8)
+
+def _first_local_max(windows):
+    """ Position of the first interior local maximum along the last axis (as find_peaks would report first, plateaus included).
+
+    Args:
+        windows (array):                Search windows, the last axis being the samples of each window.
+
+    Returns:
+        offsets (array):                Index of the first local maximum in each window.
+        found (array):                  Boolean, False where a window has no interior local maximum.
+    """
+    if windows.shape[-1] < 3:
+        # Too short to hold an interior sample (low sampling rates)
+        return np.zeros(windows.shape[:-1], dtype=np.intp), np.zeros(windows.shape[:-1], dtype=bool)
+
+    # For every sample, index of the first change of value at or after it (n_diffs where the window stays flat)
+    diffs = np.diff(windows, axis=-1)
+    n_diffs = diffs.shape[-1]
+    change_at = np.where(diffs != 0, np.arange(n_diffs), n_diffs)
+    next_change = np.minimum.accumulate(change_at[..., ::-1], axis=-1)[..., ::-1]
+
+    # A peak rises into sample i and, after any plateau, falls at next_change (find_peaks' plateau rule)
+    plateau_end = next_change[..., 1:]
+    falls = np.take_along_axis(diffs, np.minimum(plateau_end, n_diffs - 1), axis=-1) < 0
+    is_peak = (diffs[..., :-1] > 0) & (plateau_end < n_diffs) & falls
+
+    # Report the middle of the first peak's plateau, as find_peaks does
+    first = is_peak.argmax(axis=-1)[..., None]
+    offsets = (first + 1 + np.take_along_axis(plateau_end, first, axis=-1)) // 2
 
-    return "Normal"
+    return offsets[..., 0], is_peak.any(axis=-1)
 
-def analyze_pr_interval(rr_intervals, sampling_rate =1000, threshold=0.2):
+def analyze_pr_interval(ecg_data, r_peak_indices, sampling_rate=1000, threshold=0.2):
     """ Analyze the P-Q interval for atrioventricular conduction.
 
     Args:
-        rr_intervals (array-like):      RR intervals.
+        ecg_data (array-like):          The ECG signal.
+        r_peak_indices (array-like):    Indices of R-peaks.
         sampling_rate:                  Sampling frequency
-        p_peak_indices:                 P-peaks (self-annotated) 
-        qrs_peak_indices:               QRS-peaks (self-annotated)
-        threshold (float, optional):    Threshold for P-Q interval analysis. Default is 0.2.
-
-    Returns:
-        pr_interval_status (str):       "Normal" or "Abnormal" based on P-Q interval analysis.
-    """
-    # Find P-peaks (search in an [Rpeak-X] ms window: BEFORE the R-peaks)
-    p_peak_search_window = 0.04 * 1000  # 40 ms search window (adjust as needed)
-    p_peak_indices = []
-
-    for r_peak in r_peak_indices:
-        # Search for P-peaks in the search window before the R-peak
-        search_start = max(0, r_peak - p_peak_search_window)
-        search_end = r_peak
-        p_peak, _ = find_peaks(ecg_data[search_start:search_end])
-        
-        if len(p_peak) > 0:
-            p_peak_indices.append(search_start + p_peak[0])
-
-    # Find QRS peaks (search in [Rpeak+X] ms window: AFTER the R-peaks)
-    qrs_peak_search_window = 0.1 * 1000  # 100 ms search window (adjust as needed)
-    qrs_peak_indices = []
-
-    for r_peak in r_peak_indices:
-        # Search for QRS peaks in the search window after the R-peak
-        search_start = r_peak
-        search_end = r_peak + qrs_peak_search_window
-        qrs_peak, _ = find_peaks(ecg_data[search_start:search_end])
-    
-    if len(qrs_peak) > 0:
-        qrs_peak_indices.append(search_start + qrs_peak[0])
-    
-    # Calculate PR intervals
-    pr_intervals = [(qrs_peak - p_peak) / sampling_rate for p_peak, qrs_peak in zip(p_peak_indices, qrs_peak_indices)]
+        threshold (float, optional):    Expected P-Q interval in s for the analysis. Default is 0.2.
+
+    Returns:
+        pr_interval_status (int8):      0 ("Normal") or 1 ("Abnormal") based on P-Q interval analysis.
+    """
+    p_peak_search_window = int(0.04 * sampling_rate)  # 40 ms search window BEFORE the R-peaks (adjust as needed)
+    qrs_peak_search_window = int(0.1 * sampling_rate)  # 100 ms search window AFTER the R-peaks (adjust as needed)
+
+    # Drop beats whose search windows run past either end of the signal
+    ecg_data = np.asarray(ecg_data)
+    r_peak_indices = np.asarray(r_peak_indices, dtype=np.intp)
+    valid = (r_peak_indices - p_peak_search_window >= 0) & \
+            (r_peak_indices + qrs_peak_search_window <= len(ecg_data))
+    r_peak_indices = r_peak_indices[valid]
+
+    # Gather the (N_peaks, window) search blocks and take the first local maximum of each window as the P-peak / QRS-peak
+    p_windows = ecg_data[r_peak_indices[:, None] + np.arange(-p_peak_search_window, 0)[None, :]]
+    qrs_windows = ecg_data[r_peak_indices[:, None] + np.arange(0, qrs_peak_search_window)[None, :]]
+    p_peak_offsets, p_found = _first_local_max(p_windows)
+    qrs_peak_offsets, qrs_found = _first_local_max(qrs_windows)
+    p_peak_offsets -= p_peak_search_window
+
+    # Calculate PR intervals of the beats where both peaks were found
+    found = p_found & qrs_found
+    if not found.any():
+        return np.int8(0)  # No beat with both peaks to classify
+    pr_intervals = (qrs_peak_offsets[found] - p_peak_offsets[found]) / sampling_rate
 
     # Check average PR interval length and classify result 
     mean_pr_interval = np.mean(pr_intervals)
-    if abs(mean_pr_interval - 0.2) > 0.04:  # Assuming a normal P-Q interval is around 200 ms
-        return "Abnormal"
+    if abs(mean_pr_interval - threshold) > 0.04:  # Assuming a normal P-Q interval is around 200 ms
+        return np.int8(1)
     
-    return "Normal"
+    return np.int8(0)
+
+def analyze_pr_interval_batch(ecg_signals, r_peak_indices, r_peak_counts, sampling_rate=1000, threshold=0.2):
+    """ Analyze the P-Q interval for atrioventricular conduction in every row of a 2D array of ECG signals.
+
+    Args:
+        ecg_signals (array):            2D array of ECG signals, one signal per row.
+        r_peak_indices (array):         (rows, max_peaks) indices of R-peaks, as returned by find_r_peaks_batch.
+        r_peak_counts (array):          Number of R-peaks of each row.
+        sampling_rate:                  Sampling frequency
+        threshold (float, optional):    Expected P-Q interval in s for the analysis. Default is 0.2.
+
+    Returns:
+        pr_interval_status (array):     int8 per row, 0 ("Normal") or 1 ("Abnormal") based on P-Q interval analysis.
+    """
+    p_peak_search_window = int(0.04 * sampling_rate)  # Same windows as analyze_pr_interval
+    qrs_peak_search_window = int(0.1 * sampling_rate)
+
+    # Mask of the R-peak slots that hold a beat whose search windows stay inside the signal
+    n_rows, n_samples = ecg_signals.shape
+    r_peak_indices, valid = _valid_peak_slots(r_peak_indices, r_peak_counts, -p_peak_search_window,
+                                              qrs_peak_search_window, n_samples)
+
+    # Gather the (rows, max_peaks, window) search blocks and take the first local maximum of each window as the P-peak / QRS-peak
+    rows = np.arange(n_rows)[:, None, None]
+    p_windows = ecg_signals[rows, r_peak_indices[:, :, None] + np.arange(-p_peak_search_window, 0)]
+    qrs_windows = ecg_signals[rows, r_peak_indices[:, :, None] + np.arange(0, qrs_peak_search_window)]
+    p_peak_offsets, p_found = _first_local_max(p_windows)
+    qrs_peak_offsets, qrs_found = _first_local_max(qrs_windows)
+    p_peak_offsets -= p_peak_search_window
+
+    # Calculate the mean PR interval of each row over the beats where both peaks were found
+    valid &= p_found & qrs_found
+    mean_pr_intervals = _masked_row_mean((qrs_peak_offsets - p_peak_offsets) / sampling_rate, valid)
+
+    return (np.abs(mean_pr_intervals - threshold) > 0.04).astype(np.int8)
+
+@dataclass
+class EcgBatch:
+    """ Aligned (rows, ...) arrays of many ECG signals and their R-peaks, one signal per row. """
+    raw: np.ndarray                     # (rows, samples) original signals
+    denoised: np.ndarray                # (rows, samples) denoised signals
+    r_peaks: np.ndarray                 # (rows, max_peaks) int32 R-peak indices
+    n_peaks: np.ndarray                 # (rows,) int32 number of valid R-peaks
+    rr: np.ndarray                      # (rows, max_peaks - 1) float32 RR intervals in s
+
+def build_ecg_batch(raw, denoised, threshold=0.2, sampling_rate=1000):
+    """ Find the R-peaks of many denoised ECG signals and collect everything in an EcgBatch.
 
+    Args:
+        raw (array):                    2D array of the original ECG signals, one signal per row.
+        denoised (array):               2D array of the denoised ECG signals, same shape as raw.
+        threshold (float, optional):    Peak detection threshold. Default is 0.2.
+        sampling_rate (int, optional):  Sampling rate in Hz. Default is 1000.
+
+    Returns:
+        batch (EcgBatch):               The signals with their R-peaks and RR intervals.
+    """
+    denoised = np.ascontiguousarray(denoised)
+    r_peaks, rr, n_peaks = find_r_peaks_batch(denoised, threshold, sampling_rate)
+
+    return EcgBatch(raw=np.asarray(raw), denoised=denoised, r_peaks=r_peaks, n_peaks=n_peaks, rr=rr)
+
+def analyze_all(batch, sampling_rate=1000):
+    """ Calculate all ECG metrics for every signal of a batch.
+
+    Args:
+        batch (EcgBatch):               The signals with their R-peaks and RR intervals (see build_ecg_batch).
+        sampling_rate (int, optional):  Sampling rate in Hz. Default is 1000.
+
+    Returns:
+        metrics (dict):                 Per-signal arrays: "heart_rate" (BPM) and the int8 codes "rhythm_status",
+                                        "st_segment_changes", "t_wave_status" and "pr_interval_status".
+    """
+    heart_rate, rhythm_status = analyze_heart_rate_rhythm(batch.rr, batch.n_peaks, threshold=0.15)
+
+    return {
+        "heart_rate": heart_rate,
+        "rhythm_status": rhythm_status,
+        "st_segment_changes": analyze_st_segment_batch(batch.denoised, batch.r_peaks, batch.n_peaks, sampling_rate),
+        "t_wave_status": analyze_t_wave_batch(batch.denoised, batch.r_peaks, batch.n_peaks, sampling_rate, threshold=0.1),
+        "pr_interval_status": analyze_pr_interval_batch(batch.denoised, batch.r_peaks, batch.n_peaks, sampling_rate, threshold=0.2),
+    }
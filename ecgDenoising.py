@@ -1,66 +1,84 @@
-import matplotlib.pyplot as plt
+from matplotlib import mlab
 import pandas as pd
 import numpy as np
 import pywt
 import math
 import scipy
-import PyWavelet as pywt
+from functools import lru_cache
+
+
+@lru_cache(maxsize=16)
+def _get_wavelet(name):
+    """ Return the (cached) pywt.Wavelet object for a wavelet name such as 'db4'. """
+    return pywt.Wavelet(name)
 
 
 def swtDenoise(signal, waveletChoose = 'db', orderChoose = 4, levelChoose = 4, setThreshold = 0):
     """ Denoise the ECG signal using the Stationary Wavelet Transform (SWT).
 
     Args:
-        signal (array-like):                        The ECG signal.
+        signal (array-like):                        The ECG signal, or a 2D array with one ECG signal per row.
         waveletChoose (str, optional):              The choice of wavelet for SWT. Default is the daubchies wavelet'db'.
                                                     other options - Symlet 'sym', Haar 'haar' etc. 
         orderChoose (int, optional):                The order of the selected wavelet. Default is 4.
         levelChoose (int, optional):                The number of decomposition levels for SWT. Default is 4.
-        setThreshold (float, optional):             The noise threshold for coefficient thresholding. Default is 0.
+        setThreshold (float or array, optional):    The noise threshold for coefficient thresholding. Default is 0, which leaves
+                                                    the coefficients unchanged (no denoising). A (rows, 1) array sets one
+                                                    threshold per row, e.g. from universalThreshold.
 
     Returns:
-        denoised_ecg (array):                       The denoised ECG signal after SWT.
+        denoised_ecg (array):                       The denoised ECG signal(s) after SWT, same shape as the input.
     """
 
     # Construct the input to the choice of wavelet with order
     waveletOrder = waveletChoose + str(orderChoose)
 
-    # Do the DWT transform
-    if levelChoose == 1:
-        cApproximate, cDetailed = pywt.dwt(signal, waveletOrder)
-    else:
-        wv = pywt.Wavelet(waveletOrder)
-        multilevelCoefficients = pywt.wavedec(signal, waveletOrder, level=levelChoose)
-
-    # Declare wavelet to the library
-    wv = pywt.Wavelet(waveletOrder)
-
-    # Use thresholding to isolate approx. coefficients & reconstruct
-    if levelChoose == 1:
-        # Set the detailed coefficients above the desired noise threshold to the desired value
-        for k in range(0, len(cDetailed) - 1):
-            if abs(cDetailed[k]) >= setThreshold:
-                cDetailed[k] = 0
-
-        # Reconstruct using the noise thresholded coefficients
-        denoised_ecg = pywt.idwt(cApproximate, cDetailed, waveletOrder, mode='constant')
-
-    else:
-        # Set the detailed coefficients at the nth level of the transform that are above the threshold to the desired value (0 here)
-        cDetailed = multilevelCoefficients[1]
-        
-        for k in range(0, len(cDetailed) - 1):
-            if abs(cDetailed[k]) >= setThreshold:
-                cDetailed[k] = 0
-        
-        multilevelCoefficients[1] = cDetailed
-
-        # Reconstruct using the noise thresholded coefficients
-        denoised_ecg = pywt.waverec(multilevelCoefficients, wv)
+    # Declare wavelet to the library (built once per wavelet name and reused across calls)
+    wv = _get_wavelet(waveletOrder)
+
+    # The SWT needs a length divisible by 2^level: pad the end once and crop it off after reconstruction
+    signal = np.asarray(signal)
+    nSamples = signal.shape[-1]
+    padLength = -nSamples % 2 ** levelChoose
+    signal = np.pad(signal, [(0, 0)] * (signal.ndim - 1) + [(0, padLength)], mode='symmetric')
+
+    # Do the SWT transform (along the last axis, so every row of a 2D input is transformed in one call)
+    multilevelCoefficients = pywt.swt(signal, wv, level=levelChoose, trim_approx=False, norm=True, axis=-1)
+
+    # Soft-threshold the detailed coefficients at every level of the transform
+    # (written out rather than pywt.threshold, which turns exact zeros into NaN when setThreshold is 0)
+    multilevelCoefficients = [(cApproximate, np.sign(cDetailed) * np.maximum(np.abs(cDetailed) - setThreshold, 0))
+                              for cApproximate, cDetailed in multilevelCoefficients]
+
+    # Reconstruct using the noise thresholded coefficients
+    denoised_ecg = pywt.iswt(multilevelCoefficients, wv, norm=True, axis=-1)[..., :nSamples]
     
     return denoised_ecg
 
 
+def universalThreshold(signal, waveletChoose = 'db', orderChoose = 4):
+    """ Estimate the universal (VisuShrink) threshold sigma * sqrt(2 ln n) of each signal for swtDenoise.
+
+    Args:
+        signal (array-like):                        The ECG signal, or a 2D array with one ECG signal per row.
+        waveletChoose (str, optional):              The choice of wavelet. Default is the daubchies wavelet 'db'.
+        orderChoose (int, optional):                The order of the selected wavelet. Default is 4.
+
+    Returns:
+        threshold (array):                          The threshold of each signal, shaped (..., 1) to broadcast along its samples.
+    """
+
+    # Estimate the noise level from the median absolute deviation of the finest (normalised) SWT detail coefficients,
+    # the same coefficients swtDenoise thresholds
+    signal = np.asarray(signal)
+    evenSignal = np.pad(signal, [(0, 0)] * (signal.ndim - 1) + [(0, signal.shape[-1] % 2)], mode='symmetric')
+    [(_, cDetailed)] = pywt.swt(evenSignal, _get_wavelet(waveletChoose + str(orderChoose)), level=1, norm=True, axis=-1)
+    sigma = np.median(np.abs(cDetailed), axis=-1, keepdims=True) / 0.6745
+
+    threshold = sigma * np.sqrt(2 * np.log(signal.shape[-1]))
+    return threshold.astype(signal.dtype, copy=False) if np.issubdtype(signal.dtype, np.floating) else threshold
+
+
 def calculateSTDev_SNR(arr, axis=0, ddof=0):
     """ Calculate the Signal-to-Noise Ratio (SNR) based on the standard deviation.
 
@@ -73,46 +91,82 @@ def calculateSTDev_SNR(arr, axis=0, ddof=0):
         snr (array):                                The Signal-to-Noise Ratio (SNR) based on standard deviation.
     """
 
+    # Accumulate the mean and standard deviation in float64 without copying float32 input to float64
+    # (scipy.stats.variation is not used: it is not single-pass either and cannot accumulate float32 input in float64)
     arr = np.asanyarray(arr)
-    m = arr.mean(axis)
-    sd = arr.std(axis=axis, ddof=ddof)
+    m = arr.mean(axis, dtype=np.float64)
+    sd = arr.std(axis=axis, ddof=ddof, dtype=np.float64)
+
+    # Zero SNR where the standard deviation is zero
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(sd == 0, 0, m / sd)
+
+
+def batchedPSD(X, fs, nperseg=256):
+    """ Estimate the Power Spectral Density (PSD) of one or many signals with averaged, Hann-windowed FFT segments.
+
+    Args:
+        X (array-like):                             The signal, or a 2D array with one signal per row.
+        fs (float):                                 The sampling frequency in Hz.
+        nperseg (int, optional):                    The (maximum) length of each segment. Default is 256.
 
-    # [Optional] Calculate SNR at peaks
-    snrAtPeaks = 10 * np.log10(np.sum(signal[peaks] ** 2) / np.sum((signal - denoised_ecg) ** 2))
+    Returns:
+        freqs (array):                              The frequencies of the PSD bins in Hz.
+        psd (array):                                The one-sided PSD of each signal (along the last axis).
+    """
+
+    # Remove the mean of each signal and split it into whole segments, dropping the incomplete tail as welch does
+    X = np.asarray(X)
+    X = X - X.mean(axis=-1, keepdims=True)
+    nSamples = X.shape[-1]
+    nperseg = min(nperseg, nSamples)
+    nSegments = nSamples // nperseg
+    segments = X[..., :nSegments * nperseg].reshape(X.shape[:-1] + (nSegments, nperseg))
+
+    # Window all segments of all signals and transform them in a single FFT call, zero-padded to an FFT-friendly
+    # length (float32 input stays float32/complex64)
+    nfft = scipy.fft.next_fast_len(nperseg)
+    win = np.hanning(nperseg).astype(X.dtype, copy=False)
+    F = scipy.fft.rfft(segments * win, n=nfft, axis=-1)
 
-    return np.where(sd == 0, 0, m / sd)
+    # Average the segment periodograms and fold the negative frequencies into the one-sided PSD
+    psd = (np.abs(F) ** 2).mean(axis=-2) / (fs * (win ** 2).sum())
+    psd[..., 1:psd.shape[-1] - (1 - nfft % 2)] *= 2
+    freqs = np.fft.rfftfreq(nfft, 1 / fs)
+
+    return freqs, psd
 
 
 def calulatePSD_SNR(signal, denoised_ecg, fs):
     """ Calculate the Signal-to-Noise Ratio (SNR) based on Power Spectral Density (PSD).
 
     Args:
-        signal (array-like):                        The original ECG signal.
-        denoised_ecg (array-like):                  The denoised ECG signal.
+        signal (array-like):                        The original ECG signal, or a 2D array with one signal per row.
+        denoised_ecg (array-like):                  The denoised ECG signal(s), same shape as signal.
         fs (float):                                 The sampling frequency in Hz.
 
     Returns:
-        snrCal (float):                             The Signal-to-Noise Ratio (SNR) calculated from PSD.
+        snrCal (float or array):                    The Signal-to-Noise Ratio (SNR) calculated from PSD, one per signal.
     """
 
     # Find PSD > SNR etc.
-    (f_L, Sig) = scipy.signal.welch(signal, fs)
+    (f_L, Sig) = batchedPSD(signal, fs)
 
     # Removing the few [5 samples] from the beginning and end to remove transitional noise
-    (f_L, Noise) = scipy.signal.welch(denoised_ecg[5: len(denoised_ecg) - 5], fs)  
+    (f_L, Noise) = batchedPSD(np.asarray(denoised_ecg)[..., 5:-5], fs)  
 
-    # absSignalPower = np.abs(sum(Sig))**2
-    # absNoisePower = np.abs(sum(Noise))**2
-    signalPower = sum(Sig)
-    noisePower = sum(Noise)
-    print('Signal power' + str(round(signalPower, 4)) + ', Noise: ' + str(round(noisePower, 4)))
-    snrCal = 20 * math.log(signalPower / noisePower, 2)
+    # absSignalPower = np.abs(Sig.sum(axis=-1))**2
+    # absNoisePower = np.abs(Noise.sum(axis=-1))**2
+    signalPower = Sig.sum(axis=-1, dtype=np.float64)
+    noisePower = Noise.sum(axis=-1, dtype=np.float64)
+    print('Signal power' + str(np.round(signalPower, 4)) + ', Noise: ' + str(np.round(noisePower, 4)))
+    snrCal = 20 * np.log2(signalPower / noisePower)
 
     return snrCal
 
 
 def calculateGraph_SNR(signal, denoised_ecg):
-    """     Calculate the Signal-to-Noise Ratio (SNR) using the PSD function from the matplotlib library.
+    """     Calculate the Signal-to-Noise Ratio (SNR) using the PSD function from the matplotlib library (no figure is drawn).
 
     Args:
         signal (array-like):                        The original ECG signal.
@@ -122,11 +176,11 @@ def calculateGraph_SNR(signal, denoised_ecg):
         snrCal (float):                             The Signal-to-Noise Ratio (SNR) calculated from the matplotlib PSD.
     """
 
-    # Use matplotlib PSD
-    frequencies, psd_signal = plt.psd(signal, NFFT=1000, Fs=1000, noverlap=0)
-    _, psd_noise = plt.psd(signal-denoised_ecg, NFFT=1000, Fs=1000, noverlap=0)
+    # Use matplotlib PSD (mlab computes the same spectrum as plt.psd without drawing it)
+    psd_signal, frequencies = mlab.psd(signal, NFFT=1000, Fs=1000, noverlap=0)
+    psd_noise, _ = mlab.psd(signal-denoised_ecg, NFFT=1000, Fs=1000, noverlap=0)
 
-    # Calculate and pass SNR
-    snrCal = 20 * math.log(psd_signal / psd_noise, 2)
+    # Calculate and pass SNR (from the total signal and noise power)
+    snrCal = 20 * math.log2(psd_signal.sum() / psd_noise.sum())
 
     return snrCal
\ No newline at end of file
@@ -22,8 +22,12 @@ import ecgAnalyses as ecAna
 # Read data (change filename or reading function here)
 # For excel, use: pd.read_excel()
 dataTable = pd.read_csv('ptbdb_normal.csv')
-[sets, nSamples] = dataTable.shape
-print('Signal sets in table, ' + str(dataTable.shape))
+
+# Keep the signals as one C-contiguous float32 array (one signal per row) instead of going through pandas per row
+X = np.ascontiguousarray(dataTable.to_numpy(dtype=np.float32))
+del dataTable
+[sets, nSamples] = X.shape
+print('Signal sets in table, ' + str(X.shape))
 
 # If you know the sampling frequency for your signal, write it here (fs = 10000 which is a sampling frequency of 10kHz)
 # Sampling frequency and time-axis
@@ -31,75 +35,66 @@ fs = 125
 timeAxis = np.linspace(1, nSamples / fs, nSamples)
 
 # Calculate SNR
-# snr = calculateSTDev_SNR(np.array(dataTable))     # 1) Std deviation of the signal method [Rough statistical estimate] 
-# snr = calculatePSD_SNR(np.array(dataTable))       # 2) Power Spectral Density method (Signal power :Noise power ratio) [More accurate spectral power estimate] 
+# snr = calculateSTDev_SNR(X)                       # 1) Std deviation of the signal method [Rough statistical estimate] 
+# snr = calculatePSD_SNR(X)                         # 2) Power Spectral Density method (Signal power :Noise power ratio) [More accurate spectral power estimate] 
 # snr = calculateGraph_SNR()                        # 3) Calculate using the PSD function in matplotlib library
 
-# Iterate over each signal in the dataframe
-for j in range(0, sets - 1):
-
-    # Option to enable user input for: wavelet families, order, level, noise Threshold
-    # waveletChoose = input('Choose a wavelet family for conducting the spectral De-noising')
-    # orderChoose = input('Choose the order for spectral De-noising')
-    # levelChoose = input('Choose the level for spectral De-noising')
-    # setThreshold = input('Enter threshold for De-noising detail coefficients')
-
-    # Load each row in the dataTable dataframe
-    signal = dataTable.iloc[j, :]
-
-    waveletChoose = 'db'
-    orderChoose = 4
-    levelChoose = 8
-    setThreshold = 0
-
-    denoised_ecg = swtDenoise(signal, waveletChoose = 'db', orderChoose = 4, levelChoose = 8, setThreshold = 0)
-
-    # Refer to this article for using the PyWavelet SWT function directly (less control)
-    # link here once published
+# Option to enable user input for: wavelet families, order, level, noise Threshold
+# waveletChoose = input('Choose a wavelet family for conducting the spectral De-noising')
+# orderChoose = input('Choose the order for spectral De-noising')
+# levelChoose = input('Choose the level for spectral De-noising')
+# setThreshold = input('Enter threshold for De-noising detail coefficients')
+waveletChoose = 'db'
+orderChoose = 4
+levelChoose = 8
+# Universal threshold of each signal, estimated from its finest detail coefficients (0 would disable denoising)
+setThreshold = ecgDen.universalThreshold(X, waveletChoose, orderChoose)
 
-    # Find R-peaks in the denoised ECG signal
-    rPeaks, _ = ecAna.find_r_peaks(denoised_ecg, height=0.2, fs)  # Adjust threshold as needed
+# Denoise all the signals in the table with a single (row-wise) SWT call
+denoised = ecgDen.swtDenoise(X, waveletChoose, orderChoose, levelChoose, setThreshold)
 
-    # Calculate the heart rate and RR intervals for the given denoised signal data from R-peaks
-    HR, RRintervals = ecAna.calculate_heart_rate(rPeaks, fs)
+# Refer to this article for using the PyWavelet SWT function directly (less control)
+# link here once published
 
-    # Analyze hear rhythm based on R-R intervals
-    HeartRhythmState = ecAna.analyze_rhythm(RRintervals, threshold=0.15)
+# Find R-peaks and R-R intervals in all the denoised ECG signals at once, and keep them aligned with the signals
+batch = ecAna.build_ecg_batch(X, denoised, 0.2, fs)  # Adjust threshold as needed
 
-    # Calculate ST-segments and anlayze changes
-    STsegmentState = ecAna.analyze_st_segment(denoised_ecg, rPeaks, fs)
+# Calculate the heart rate, heart rhythm, ST segment, T-wave and P-R interval states of every signal in one call
+metrics = pd.DataFrame(ecAna.analyze_all(batch, fs))
+metrics.columns = ['Heart rate', 'Hear rhythm state', 'ST segment state', 'T-Wave state', 'PT interval state']
 
-    # Analyze T-waves for abnormalities
-    TwaveState = ecAna.analyze_t_wave(denoised_ecg, threshold=0.1)
+# Display all metrics, translating the state codes to their labels once
+display = metrics.copy()
+display['Hear rhythm state'] = ecAna.RHYTHM_LABELS[metrics['Hear rhythm state']]
+for stateColumn in ['ST segment state', 'T-Wave state', 'PT interval state']:
+    display[stateColumn] = ecAna.STATUS_LABELS[metrics[stateColumn]]
+print(display.to_string())
 
-    # Use P-peaks and QRS intervals to extract the the P-R intervals
-    PTintervalState = ecAna.analyze_pr_interval(RRintervals, fs, threshold=0.2)
+# Choose to plot the raw and denoised ECG signal 
+plotData = 0
 
-    # Display all metrics
-    print("Heart rate: ", HR)
-    print("Hear rhythm state: ", HeartRhythmState)
-    print("ST segment state: ", STsegmentState)
-    print("T-Wave state: ", TwaveState)
-    print("PT interval state: ", PTintervalState)
+# Plot data 
+if plotData == 1:
 
-    # Choose to plot the raw and denoised ECG signal 
-    plotData = 0
+    for j in range(0, sets):
 
-    # Plot data 
-    if plotData == 1
+        # Load each row of the signal array
+        signal = X[j]
+        denoised_ecg = denoised[j]
+        snrCal = ecgDen.calulatePSD_SNR(signal, denoised_ecg, fs)
 
         # Plot each dataset
         plt.figure(1)  # Create figure window
         plt.subplot(211)
         plt.plot(timeAxis, signal)
-        plt.plot(timeAxis, signalReconstructed, color='red')
+        plt.plot(timeAxis, denoised_ecg, color='red')
         plt.title('Signal set:' + str(j + 1) + ', SNR: ' + str(round(snrCal, 4)))
         plt.ylabel('Amplitude [a.u.]')
         plt.tick_params(axis='x', which='minor', pad=10)
         
         # Plot the noise + PSD
         plt.subplot(212)
-        plt.plot(timeAxis, signal - signalReconstructed, color='black')
+        plt.plot(timeAxis, signal - denoised_ecg, color='black')
         plt.title('Subtracted noise in the signal' + str(j + 1))
         plt.xlabel('Time [s]')
         plt.ylabel('Noise Amplitude [a.u.]')